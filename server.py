@@ -2,8 +2,9 @@ from mcp.server.fastmcp import FastMCP
 from datetime import datetime
 from typing import List, Dict, Any
 from pathlib import Path
+import asyncio
 import os
-from dotenv import load_dotenv
+import threading
 
 class JournalConfig:
     """Configuration handler for journaling server."""
@@ -15,22 +16,44 @@ class JournalConfig:
         "FILE_EXTENSION": "md",
     }
     
+    __slots__ = (
+        "journal_dir",
+        "file_prefix",
+        "file_extension",
+        "journal_pattern",
+        "_journal_dir_prefix",
+        "_cached_default_date",
+        "_cached_default_path",
+    )
+    
     def __init__(self):
         """
         Initialize journal configuration.
         
         """
         
-        # Load configuration from environment variables with defaults
-        self.journal_dir = Path(os.getenv("JOURNAL_DIR", self.DEFAULTS["JOURNAL_DIR"]))
-        self.file_prefix = os.getenv("FILENAME_PREFIX", self.DEFAULTS["FILENAME_PREFIX"])
-        self.file_extension = os.getenv("FILE_EXTENSION", self.DEFAULTS["FILE_EXTENSION"])
+        # Load configuration from environment variables with defaults (single pass)
+        env = {key: os.getenv(key, default) for key, default in self.DEFAULTS.items()}
+        self.journal_dir = Path(env["JOURNAL_DIR"])
+        self.file_prefix = env["FILENAME_PREFIX"]
+        self.file_extension = env["FILE_EXTENSION"]
+        
+        # Default filepath cache, rebuilt when the date changes
+        self._cached_default_date = ""
+        self._cached_default_path = None
         
         # Create journal directory
         self.journal_dir.mkdir(parents=True, exist_ok=True)
         
+        # Canonical journal directory (symlinks resolved) plus separator,
+        # computed once the directory exists, for containment checks
+        self._journal_dir_prefix = os.path.join(os.path.realpath(self.journal_dir), "")
+        
         # Validate configuration
         self._validate_config()
+        
+        # Glob-style pattern describing journal file names
+        self.journal_pattern = f"{self.file_prefix}*{self.file_extension}"
     
     def _validate_config(self):
         """Validate configuration values."""
@@ -38,10 +61,13 @@ class JournalConfig:
             self.file_extension = '.' + self.file_extension
     
     def get_default_filepath(self) -> Path:
-        """Get default filepath for current date."""
+        """Get default filepath for current date, cached until the date changes."""
         today = datetime.now().strftime("%Y-%m-%d")
-        filename = f"{self.file_prefix}_{today}{self.file_extension}"
-        return self.journal_dir / filename
+        if today != self._cached_default_date:
+            filename = f"{self.file_prefix}_{today}{self.file_extension}"
+            self._cached_default_path = Path(os.path.join(self.journal_dir, filename))
+            self._cached_default_date = today
+        return self._cached_default_path
     
     def resolve_filepath(self, filepath: str = None) -> Path:
         """
@@ -56,34 +82,65 @@ class JournalConfig:
         if filepath is None:
             return self.get_default_filepath()
             
-        path = Path(filepath)
+        # Work on plain strings and build a Path only for the result
+        path = os.fspath(filepath)
         
         # If path is just a filename, put it in journal directory
-        if not path.is_absolute():
-            path = self.journal_dir / path
+        if not os.path.isabs(path):
+            path = os.path.join(self.journal_dir, path)
+        
+        # Normalize ".." lexically
+        abs_path = os.path.abspath(path)
         
         # Ensure file has correct extension
-        if not str(path).endswith(self.file_extension):
-            path = path.with_suffix(self.file_extension)
+        if not abs_path.endswith(self.file_extension):
+            abs_path = os.path.splitext(abs_path)[0] + self.file_extension
             
-        # Ensure path is within journal directory
+        # Ensure path is within journal directory. Symlinks are resolved so a
+        # link inside the directory can't point the write elsewhere; compare
+        # against the directory plus separator so siblings like "journalX"
+        # don't match
         try:
-            path = path.resolve()
-            if not str(path).startswith(str(self.journal_dir.resolve())):
+            real_path = os.path.realpath(abs_path, strict=False)
+            if not real_path.startswith(self._journal_dir_prefix):
                 raise ValueError("Path must be within journal directory")
-        except (RuntimeError, ValueError):
+        except (OSError, RuntimeError, ValueError):
             raise ValueError("Invalid filepath")
             
-        return path
+        return Path(real_path)
     
-# Initialize server with configuration
-load_dotenv()
+# Initialize server with configuration; .env loading (and the dotenv import)
+# can be skipped when the environment is provided by the deployment
+if os.getenv("DISABLE_DOTENV") != "1":
+    from dotenv import load_dotenv
+    load_dotenv()
 config = JournalConfig()
 mcp = FastMCP("journaling")
 
 # Global state
 conversation_log: List[Dict[str, Any]] = []
 
+# Transcript label for each speaker
+SPEAKER_LABELS = {"user": "You", "assistant": "Assistant"}
+
+# Cached journals://recent content. The key combines the journal directory
+# mtime (files added/removed), the mtimes of the files shown (edits) and a
+# counter bumped on every save (filesystems with coarse mtime resolution).
+_recent_journals_cache: Dict[str, Any] = {"key": None, "files": None, "content": None}
+_save_generation = 0
+
+# Serializes journal appends and _save_generation updates; saves run in
+# worker threads (asyncio.to_thread) and may overlap
+_save_lock = threading.Lock()
+
+def _recent_journals_key(files: List[Path]) -> tuple:
+    """Build the cache key for the given list of recent journal files."""
+    return (
+        config.journal_dir.stat().st_mtime_ns,
+        _save_generation,
+        tuple(file.stat().st_mtime_ns for file in files),
+    )
+
 @mcp.prompt()
 def start_journaling() -> str:
     """
@@ -96,7 +153,7 @@ def start_journaling() -> str:
     Then start our conversation by asking how I'm feeling today, taking into account any patterns or ongoing situations from previous entries.
     Let's begin - how are you feeling today?"""
 
-async def save_journal_entry(content: str, filepath: str = None) -> str:
+def save_journal_entry(content: str, filepath: str = None) -> str:
     """
     Save journal content to a markdown file.
     
@@ -108,16 +165,26 @@ async def save_journal_entry(content: str, filepath: str = None) -> str:
     Returns:
         str: Confirmation message with filepath
     """
+    global _save_generation
     try:
         # Get and validate filepath
         path = config.resolve_filepath(filepath)
   
-        # Ensure directory exists
-        path.parent.mkdir(parents=True, exist_ok=True)
-        
-        # Write content
-        with open(path, 'a', encoding='utf-8') as file:
-            file.write(content + "\n\n")
+        with _save_lock:
+            # Open for append; the directory normally exists, so only create
+            # it (and retry) when the open fails
+            try:
+                file = open(path, 'a', encoding='utf-8')
+            except FileNotFoundError:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                file = open(path, 'a', encoding='utf-8')
+            
+            # Write content
+            with file:
+                file.write(content + "\n\n")
+            
+            # Invalidate cached journals://recent content
+            _save_generation += 1
             
         return f"Journal saved to: {path}"
         
@@ -127,7 +194,7 @@ async def save_journal_entry(content: str, filepath: str = None) -> str:
         return f"Error saving journal: {str(e)}"
 
 @mcp.tool()
-async def start_new_session() -> str:
+def start_new_session() -> str:
     """
     Start a new journaling session by clearing previous conversation log.
     
@@ -138,7 +205,7 @@ async def start_new_session() -> str:
     return f"New journaling session started. Entries will be saved to {config.journal_dir}"
 
 @mcp.tool()
-async def record_interaction(user_message: str, assistant_message: str) -> str:
+def record_interaction(user_message: str, assistant_message: str) -> str:
     """
     Record both the user's message and assistant's response.
     
@@ -149,18 +216,21 @@ async def record_interaction(user_message: str, assistant_message: str) -> str:
     Returns:
         str: Confirmation message
     """
+    # Both messages of an exchange share one timestamp
+    timestamp = datetime.now()
+    
     # Add user message first
     conversation_log.append({
         "speaker": "user",
         "message": user_message,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": timestamp
     })
     
     # Then add assistant message
     conversation_log.append({
         "speaker": "assistant",
         "message": assistant_message,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": timestamp
     })
     
     return "Conversation updated"
@@ -187,16 +257,18 @@ async def generate_session_summary(summary: str) -> str:
     
     # Add conversation transcript
     lines.append("## Conversation\n")
-    for entry in conversation_log:
-        speaker = "You" if entry["speaker"] == "user" else "Assistant"
-        timestamp = datetime.fromisoformat(entry["timestamp"]).strftime("%H:%M")
-        lines.append(f"**{speaker} ({timestamp})**: {entry['message']}\n")
+    lines.extend(
+        f"**{SPEAKER_LABELS[entry['speaker']]} "
+        f"({entry['timestamp']:%H:%M})**: "
+        f"{entry['message']}\n"
+        for entry in conversation_log
+    )
     
     # Add reflection prompt for emotional analysis
     lines.append("\n## Emotional Analysis\n")
     lines.append(summary)
     file_text = "\n".join(lines)
-    await save_journal_entry(file_text)
+    await asyncio.to_thread(save_journal_entry, file_text)
     
     return "Conversation saved to journal"
 
@@ -205,17 +277,37 @@ def get_recent_journals() -> str:
     """Get contents of 5 most recent journal entries."""
 
     try:
-        pattern = f"{config.file_prefix}*{config.file_extension}"
+        # Serve cached content while nothing relevant changed on disk
+        cache = _recent_journals_cache
+        if cache["files"] is not None:
+            try:
+                if _recent_journals_key(cache["files"]) == cache["key"]:
+                    return cache["content"]
+            except OSError:
+                pass
         
-        files = sorted(config.journal_dir.glob(pattern), reverse=True)
+        # One scandir pass; name filtering is plain string work and
+        # is_file() uses the cached directory entry type
+        with os.scandir(config.journal_dir) as it:
+            names = [
+                entry.name for entry in it
+                if entry.name.startswith(config.file_prefix)
+                and entry.name.endswith(config.file_extension)
+                and entry.is_file()
+            ]
+        names.sort(reverse=True)
+        files = [config.journal_dir / name for name in names[:5]]
+        key = _recent_journals_key(files)
 
         entries = []
-        for file in files[:5]:
+        for file in files:
             entries.append(f"# Journal from {file.stem.replace(config.file_prefix + '_', '')}\n")
             entries.append(file.read_text(encoding='utf-8'))
             entries.append("\n---\n")
             
-        return "\n".join(entries) if entries else f"No journal entries found in {config.journal_dir} matching {pattern}"
+        content = "\n".join(entries) if entries else f"No journal entries found in {config.journal_dir} matching {config.journal_pattern}"
+        cache.update(key=key, files=files, content=content)
+        return content
     except Exception as e:
         return f"Error reading journals: {str(e)}"
 